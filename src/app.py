@@ -1,29 +1,28 @@
-import re
-import json
+import asyncio
 import logging
-import random
-import requests
-import urllib.parse
 
-from typing import Any, Dict, List
+import numpy as np
 
-from google.oauth2.credentials import Credentials
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import json_io
 
-from mind import AnswerStrategyFactory
+from mind import RNG, AnswerStrategy, AnswerStrategyFactory, CompletionSession
 
 logger = logging.getLogger(__name__)
 
+# Every answerable item of a form, paired with the strategy that answers it
+QuestionPlan = List[Tuple[AnswerStrategy, Dict[str, Any]]]
 
-FORMS_API_URL = "https://forms.googleapis.com/v1/forms"
 
-
-def _generate_gaussian_sentiment(sentiment_level: str):
+def sentiment_batch(sentiment_level: str, n: int) -> np.ndarray:
     """
-    Generates a sentiment score based on the specified sentiment level.
+    Generates `n` sentiment scores based on the specified sentiment level in one
+    vectorized draw.
 
     :param sentiment_level: "low", "medium", or "high"
-    :return: A float between 0.0 and 1.0, clamped within valid range.
+    :param n: How many scores to generate, usually one per submission.
+    :return: An array of floats between 0.0 and 1.0, clamped within valid range.
     """
     sentiment_map = {
         "low": (0.2, 0.1),  # Mean 0.2, low variance
@@ -32,8 +31,18 @@ def _generate_gaussian_sentiment(sentiment_level: str):
     }
 
     mean, std_dev = sentiment_map.get(sentiment_level, (0.5, 0.2))  # Default to medium
-    sentiment_score = random.gauss(mean, std_dev)
-    return max(0.0, min(1.0, sentiment_score))  # Clamp between [0,1]
+    sentiment_scores = RNG.normal(mean, std_dev, size=n)
+    return np.clip(sentiment_scores, 0.0, 1.0, out=sentiment_scores)  # Clamp to [0,1]
+
+
+def generate_gaussian_sentiment(sentiment_level: str) -> float:
+    """
+    Generates a sentiment score based on the specified sentiment level.
+
+    :param sentiment_level: "low", "medium", or "high"
+    :return: A float between 0.0 and 1.0, clamped within valid range.
+    """
+    return float(sentiment_batch(sentiment_level, 1)[0])
 
 
 def gather_entry_data_init(data: dict) -> dict:
@@ -43,216 +52,195 @@ def gather_entry_data_init(data: dict) -> dict:
     in questionGroupItem.
     """
     ENTRY_LABEL = "entry.XXXX"
-    entry_questions_data = {}
+    entry_questions_data: Dict[str, str] = {}
 
     for item in data.get("items", []):
         # -- If the item itself has a title, store it:
         #    (Typically single-question items do.)
-        if "title" in item and item["title"].strip():
-            title = item["title"].strip()
+        title = item.get("title", "").strip()
+        if title:
             entry_questions_data[title] = ENTRY_LABEL
 
-        # -- If there's a questionGroupItem, also gather row questions:
+        # -- If there's a questionGroupItem, also gather row questions right
+        #    after it (rows without a rowQuestion are skipped):
         if "questionGroupItem" in item:
-            group_questions = item["questionGroupItem"].get("questions", [])
-            for row_q in group_questions:
-                row_title = row_q["rowQuestion"]["title"].strip()
-                entry_questions_data[row_title] = ENTRY_LABEL
+            group_questions = item["questionGroupItem"].get("questions", ())
+            entry_questions_data.update(
+                dict.fromkeys(
+                    (
+                        row_q["rowQuestion"]["title"].strip()
+                        for row_q in group_questions
+                        if "rowQuestion" in row_q
+                    ),
+                    ENTRY_LABEL,
+                )
+            )
 
     return entry_questions_data
 
 
-def _map_entry_with_question(
-    form_id: str, data: List[Dict[str, Any]]
-) -> tuple[List[Dict[str, Any]], int]:
+def _is_section_title(title: str) -> bool:
     """
-    data: list of dictionaries, each with "entryId", "questionId", "question_title", "answer".
-    form_id: the form ID (e.g., "1VsR5Ar...").
+    Returns True for titles shaped like "Section <number>: ...", checked with
+    plain string operations instead of a regex.
+    """
+    head, sep, _ = title.partition(":")
+    return (
+        bool(sep)
+        and head.startswith("Section")
+        and head[7:8].isspace()
+        and head[7:].lstrip().isdigit()
+    )
+
 
-    Returns: the same list, but with each "entryId" replaced by the actual "entry.xxx" value
-             from entry_data.json, if found.
+# { form_id: (form_mapping, section_count) }, filled by _load_entry_map
+_ENTRY_MAPS: Dict[str, Tuple[Dict[str, str], int]] = {}
+
+
+def _load_entry_map(form_id: str) -> Tuple[Dict[str, str], int]:
     """
-    # Load entire mapping file
+    Loads the { question_title: "entry.XXXX" } mapping of a form from
+    data/entry_data_<form_id>.json, along with how many "Section N: ..."
+    titles it contains. The result is memoized per form_id, until
+    invalidate_entry_map(form_id) is called.
+    """
+    cached = _ENTRY_MAPS.get(form_id)
+    if cached is not None:
+        return cached
+
     entry_file_name = f"data/entry_data_{form_id}.json"
-    with open(entry_file_name, "r") as f:
-        all_forms_entry_data = json.load(f)
+    all_forms_entry_data = json_io.read(entry_file_name)
 
-    # Get the specific mapping for this form_id
-    form_mapping = all_forms_entry_data.get(form_id)
+    # Keys are hand-edited, normalize them once so lookups need no stripping
+    raw_mapping = all_forms_entry_data.get(form_id) or {}
+    form_mapping = {k.strip(): v for k, v in raw_mapping.items()}
+    section_count = sum(1 for k in form_mapping if _is_section_title(k))
+    _ENTRY_MAPS[form_id] = form_mapping, section_count
+    return form_mapping, section_count
 
-    # Retrieve how many Section are in form
-    section_count = len([k for k in form_mapping if re.search(r"^Section\s+\d+:", k)])
 
-    if not form_mapping:
-        logger.error(f"No entry data found for form ID: {form_id}")
-        return data  # or raise an exception if you prefer
-
-    # Now iterate over the list of questions
-    for item in data:
-        # Make sure we skip anything that isn't a dictionary
-        if not isinstance(item, dict):
-            continue  # or remove these extra strings from your list entirely
-
-        question_title = item.get("question_title").strip()
-        if not question_title:
-            continue  # or raise an error if "question_title" is missing
-
-        # Lookup the 'entry.xxx' using the question title
-        # (Be mindful of extra spaces or punctuation changes between the JSON and the form)
-        if question_title not in form_mapping:
-            raise ValueError(
-                f"No matching entry ID found in entry_data.json for question title: {question_title}"
-            )
+def invalidate_entry_map(form_id: str) -> None:
+    """Forgets the loaded entry mapping of a form, so it is read again next time."""
+    _ENTRY_MAPS.pop(form_id, None)
 
-        # Assign the entry.xxx to the item's "entryId"
-        item["entryId"] = form_mapping[question_title]
 
-    return data, section_count
+def classify_questions(questions: List[Dict[str, Any]]) -> QuestionPlan:
+    """
+    Resolves the answer strategy of every question once, so repeated submissions
+    of the same form skip the factory dispatch. Items that are neither a question
+    nor a grid (page breaks, text blocks, ...) are left out.
+    """
+    plan: QuestionPlan = []
+    for question in questions:
+        if "questionGroupItem" not in question and "questionItem" not in question:
+            continue
+        try:
+            plan.append((AnswerStrategyFactory.get_strategy(question), question))
+        except ValueError as e:
+            logger.error(
+                "Skipping unsupported question %r: %s", question.get("title", ""), e
+            )
+    return plan
 
 
-def generate_answer(question: Dict[str, Any], sentiment_score: float) -> Any:
+async def agenerate_answer(
+    question: Dict[str, Any],
+    sentiment_score: float,
+    completions: CompletionSession,
+    strategy: Optional[AnswerStrategy] = None,
+) -> Any:
     """Uses the Strategy Pattern to generate answers based on the question type."""
     try:
-        strategy = AnswerStrategyFactory.get_strategy(question)
-        return strategy.generate_answer(question, sentiment_score)
+        strategy = strategy or AnswerStrategyFactory.get_strategy(question)
+        return await strategy.agenerate_answer(question, sentiment_score, completions)
     except ValueError as e:
-        logging.error(f"Error generating answer: {e}")
+        logger.error("Error generating answer: %s", e)
         return None
 
 
-def generate_submission_payload(
-    form_id: str, questions: List[Dict[str, Any]], sentiment_score: float
-) -> str:
+def _emit_pairs(
+    form_mapping: Dict[str, str], answers: Iterable[Any]
+) -> Iterator[Tuple[str, str]]:
     """
-    Generates the final query-string payload (the part after '?') for submitting or pre-filling
-    form responses. The string begins with "usp=pp_url" and includes repeated entries like
-    entry.XXXX=ANSWER for each answer.
-
-    :param form_id: The Google Form ID
-    :param questions: A list of question objects (like those from your Form JSON),
-                      each potentially containing 'questionItem' or 'questionGroupItem'.
-    :return: A query-string-like string ready to be appended to a Google Forms URL.
+    Yields every answer as ("entry.XXXX", ANSWER) pairs, looking up each entry
+    ID as it goes.
     """
-    # 1) Gather answers from all questions
-    all_answers = []
-    for question in questions:
-        if "questionGroupItem" in question:
-            # This is a matrix/grid question – generate a list of answers for each row
-            # e.g., generate_answer(question) returns multiple row-answers
-            row_answers = generate_answer(question, sentiment_score)
-            all_answers.extend(row_answers)
-        elif "questionItem" in question:
-            # This is a standard question
-            answer_obj = generate_answer(question, sentiment_score)
-            if answer_obj:
-                all_answers.append(answer_obj)
-
-    # 2) Map each question or row-answer from your data to the correct entry.xxx
-    #    e.g., item["question_title"] => item["entryId"]
-    data_with_entry_id, section_count = _map_entry_with_question(form_id, all_answers)
-
-    # 3) Build the 'usp=pp_url&entry.XXXX=ANSWER' string
-
-    if section_count > 0:
-        action = "&pageHistory=" + ",".join(str(i) for i in range(section_count + 1))
-    else:
-        action = "usp=pp_url"
-
-    parts = [action]
-    for item in data_with_entry_id:
-        entry_id = item["entryId"]  # e.g. "entry.343824263"
-        for answer in item["answers"]:
-            encoded_answer = urllib.parse.quote_plus(answer)
-            parts.append(f"{entry_id}={encoded_answer}")
-
-    # Join into the final query string
-    return "&".join(parts)
-
-
-def fetch_form_data(credentials: Credentials, form_id: str) -> Dict[str, Any]:
+    for answer in answers:
+        if not answer:
+            continue  # the question was skipped
+
+        # A matrix/grid question returns a list with one answer per row
+        for item in answer if isinstance(answer, list) else (answer,):
+            # Strategies return titles already stripped
+            question_title = item.get("question_title")
+            if not question_title:
+                continue  # or raise an error if "question_title" is missing
+
+            # Lookup the 'entry.xxx' using the question title
+            # (Be mindful of extra spaces or punctuation changes between the JSON and the form)
+            if question_title not in form_mapping:
+                raise ValueError(
+                    f"No matching entry ID found in entry_data.json for question title: {question_title}"
+                )
+
+            entry_id = form_mapping[question_title]
+            for value in item["answers"]:
+                yield entry_id, value
+
+
+def _load_submission_fields(
+    form_id: str,
+) -> Tuple[List[Tuple[str, str]], Dict[str, str]]:
     """
-    Fetches questions from a Google Form using the Google Forms API.
-
-    Args:
-        credentials (Credentials): Authenticated Google OAuth credentials.
-        form_id (str): The Google Form ID.
-
-    Returns:
-        Dict[str, Any]: The form data as a dictionary, or an error message.
+    Returns the navigation fields every submission starts with, plus the
+    entry mapping of the form. Raises ValueError when the form has no entry
+    data, so nothing is submitted without answers.
     """
-    url = f"{FORMS_API_URL}/{form_id}"
-    headers = {"Authorization": f"Bearer {credentials.token}"}
+    # Get the specific mapping for this form_id, and how many Section are in form
+    form_mapping, section_count = _load_entry_map(form_id)
 
-    try:
-        logger.info(f"Fetching form questions for Form ID: {form_id}...")
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            logger.error(
-                f"Failed to fetch form questions. Status Code: {response.status_code}"
-            )
-            return {"error": response.json()}
-
-        logger.info("Form questions retrieved successfully.")
-        return response.json()
+    # A multi-section form must list every page it went through, e.g. "0,1,2"
+    if section_count > 0:
+        fields = [("pageHistory", ",".join(map(str, range(section_count + 1))))]
+    else:
+        fields = [("usp", "pp_url")]
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request failed: {e}")
-        return {"error": str(e)}
+    if not form_mapping:
+        raise ValueError(f"No entry data found for form ID: {form_id}")
+    return fields, form_mapping
 
 
-def submit_form(
-    credentials: Credentials, form_id: str, sentiment_level: str
-) -> Dict[str, Any]:
+async def agenerate_submission_payload(
+    form_id: str,
+    questions: List[Dict[str, Any]],
+    sentiment_score: float,
+    completions: CompletionSession,
+    plan: Optional[QuestionPlan] = None,
+) -> List[Tuple[str, str]]:
     """
-    Fetches Google Form questions, generates answers, and submits the form.
+    Generates the form fields for submitting or pre-filling form responses. The list
+    begins with ("usp", "pp_url") (or the "pageHistory" of a multi-section form) and
+    includes a repeated ("entry.XXXX", ANSWER) pair for each answer. Every question
+    is answered concurrently, so the OpenAI round-trips of text questions overlap
+    instead of running one after the other.
 
-    Args:
-        credentials: Authenticated Google OAuth credentials.
-        form_id (str): The Google Form ID.
-
-    Returns:
-        Dict[str, Any]: The API response from the Google Forms submission.
+    :param form_id: The Google Form ID
+    :param questions: A list of question objects (like those from your Form JSON),
+                      each potentially containing 'questionItem' or 'questionGroupItem'.
+    :param completions: The OpenAI session of the run, used by text questions.
+    :param plan: The result of classify_questions(questions), if already computed.
+    :return: A list of (field, value) pairs, ready to be urlencoded as the request body.
     """
+    if plan is None:
+        plan = classify_questions(questions)
 
-    logging.info("Fetching form questions...")
-    form_data = fetch_form_data(credentials, form_id)
-
-    responder_url = form_data.get("responderUri", "")
-    if not responder_url:
-        logging.warning("No responderUri found in form_data.")
-        return {"success": False, "error": "No responderUri"}
+    fields, form_mapping = _load_submission_fields(form_id)
 
-    # Change 'viewform' to 'formResponse'
-    submit_url = responder_url.replace("/viewform", "/formResponse")
-
-    # Extract the questions array from the JSON
-    questions = form_data.get("items", [])
-
-    #  Randomly assign a sentiment score (0.0 - 1.0) with more weight on higher range
-    sentiment_score = _generate_gaussian_sentiment(sentiment_level)
-    logger.info(
-        f"Assigning a sentiment {sentiment_level} with score: {sentiment_score}"
+    answers = await asyncio.gather(
+        *(
+            agenerate_answer(question, sentiment_score, completions, strategy)
+            for strategy, question in plan
+        )
     )
-
-    # Build your query-string payload (e.g., 'usp=pp_url&entry.XXXX=answer...')
-    payload = generate_submission_payload(form_id, questions, sentiment_score)
-
-    # logging.debug(f"Generated payload: {payload}")
-
-    # Construct the final URL:
-    # e.g. 'https://docs.google.com/forms/d/e/.../formResponse?usp=pp_url&entry.XXXX=ANSWER...'
-    final_url = f"{submit_url}?{payload}"
-
-    logging.debug(f"Making GET request to: {final_url}")
-    try:
-        response = requests.get(final_url)
-        # Optional: raise an exception if the status code indicates an error
-        response.raise_for_status()
-        return {
-            "success": True,
-            "status_code": response.status_code,
-            "response_text": response.text,
-        }
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Request error: {e}", exc_info=True)
-        return {"success": False, "error": str(e)}
+    fields.extend(_emit_pairs(form_mapping, answers))
+    return fields
@@ -17,6 +17,18 @@ SCOPES = [
 CLIENT_SECRET_FILE = "credentials.json"  # OAuth JSON file from Google Cloud
 TOKEN_FILE = "token.json"  # Stores access token after authentication
 
+# Credentials handed out by the last authenticate() call, and the mtime of the
+# token file they were read from / written to
+_CREDS: Optional[Credentials] = None
+_CREDS_MTIME: Optional[float] = None
+
+
+def _token_mtime() -> Optional[float]:
+    try:
+        return os.stat(TOKEN_FILE).st_mtime
+    except OSError:
+        return None
+
 
 def authenticate() -> Optional[Credentials]:
     """
@@ -26,6 +38,13 @@ def authenticate() -> Optional[Credentials]:
         Optional[Credentials]: A valid Google OAuth2 credentials object if authentication is successful,
         otherwise None.
     """
+    global _CREDS, _CREDS_MTIME
+
+    # Reuse the credentials of a previous call, unless the token file was
+    # rotated on disk since then
+    if _CREDS is not None and _CREDS.valid and _token_mtime() == _CREDS_MTIME:
+        return _CREDS
+
     creds: Optional[Credentials] = None
 
     # Load existing token if available
@@ -41,7 +60,7 @@ def authenticate() -> Optional[Credentials]:
                 creds.refresh(Request())
                 logger.info("Token refreshed successfully.")
             except Exception as e:
-                logger.error(f"Token refresh failed: {e}")
+                logger.error("Token refresh failed: %s", e)
                 return None
         else:
             logger.info("No valid credentials found. Initiating authentication flow.")
@@ -52,7 +71,7 @@ def authenticate() -> Optional[Credentials]:
                 creds = flow.run_local_server(port=0)  # Opens browser for login
                 logger.info("Authentication successful.")
             except Exception as e:
-                logger.error(f"Authentication failed: {e}")
+                logger.error("Authentication failed: %s", e)
                 return None
 
         # Save credentials for future use
@@ -61,7 +80,8 @@ def authenticate() -> Optional[Credentials]:
                 token_file.write(creds.to_json())
                 logger.info("Credentials saved successfully.")
         except Exception as e:
-            logger.error(f"Failed to save credentials: {e}")
+            logger.error("Failed to save credentials: %s", e)
             return None
 
+    _CREDS, _CREDS_MTIME = creds, _token_mtime()
     return creds
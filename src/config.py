@@ -1,13 +1,27 @@
+OPENAI_MODEL = "gpt-4o-mini"
 AI_PROMPT = "You are an employee filling out a research form. Respond with a short, keyword-based phrase from your perspective—no full sentences, just concise terms in a single line."
 
-SKIP_WORDS = {"none of the above", "don’t know", "not sure", "n/a", "prefer not to say"}
-SKIP_PHRASES = {"(optional)", "email"}
-IGNORE_SENTIMENT_QUESTIONS = {
-    "SD",
-}
+# Lowercase; frozensets so membership checks are O(1) and the values are immutable
+SKIP_WORDS = frozenset(
+    {"none of the above", "don’t know", "not sure", "n/a", "prefer not to say"}
+)
+SKIP_PHRASES = frozenset({"(optional)", "email"})
+# Matched case-insensitively against the words of the question title
+IGNORE_SENTIMENT_QUESTIONS = frozenset(
+    word.lower()
+    for word in {
+        "SD",
+    }
+)
 
 PREDEFINED_VALUES = {
     # "question_text": {"answer_choice_1", "answer_choice_n" }
     # "country": ("Romania", "Germany", "Austria")
     "country": ("Romania",)
 }
+
+# Raw OpenAI completions are cached here, keyed by prompt, question and model
+ANSWER_CACHE_FILE = "data/answer_cache.sqlite"
+
+# Upper bound of submissions in flight at once (submit_form.py --concurrency)
+MAX_CONCURRENT_SUBMISSIONS = 8
@@ -0,0 +1,565 @@
+import os
+import time
+import asyncio
+import datetime
+import io
+import random
+import logging
+import httpx
+
+from urllib.parse import quote_plus, urlencode
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from openai import OpenAIError
+
+import json_io
+
+from config import MAX_CONCURRENT_SUBMISSIONS
+from mind import CompletionSession
+
+from app import (
+    QuestionPlan,
+    agenerate_submission_payload,
+    classify_questions,
+    generate_gaussian_sentiment,
+    invalidate_entry_map,
+    sentiment_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+
+FORMS_API_URL = "https://forms.googleapis.com/v1/forms"
+
+USER_AGENT = "google-forms-auto-fill/1.0"
+
+# Upper bound of forms fetched at once by fetch_forms_bulk
+MAX_CONCURRENT_FETCHES = 8
+
+# How long (in seconds) a fetched form schema is reused before refetching it
+FORM_CACHE_TTL = 600
+
+# Rate limiting and transient server errors are retried with exponential backoff
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# A submission POST is not idempotent: a 5xx from Google's front end may come
+# after the response was recorded. Only retry when it surely was not, on 429,
+# or on 503 when it carries Retry-After.
+SUBMIT_RETRY_STATUSES = frozenset({429})
+SUBMIT_RETRY_AFTER_STATUSES = frozenset({503})
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5  # seconds, doubled on every attempt
+RETRY_MAX_DELAY = 30.0
+
+# Refresh the access token this long (in seconds) before it expires during a batch
+TOKEN_REFRESH_MARGIN = 60
+
+# { form_id: (expires_at, form_data, plan, submit_url) }, expires_at is on
+# time.monotonic()
+_FORM_CACHE: Dict[str, Tuple[float, Dict[str, Any], QuestionPlan, str]] = {}
+
+# Fetched forms are also saved here as {"fetched_at": <unix time>, "form": ...},
+# so later runs within FORM_CACHE_TTL start without a Forms API request
+FORM_CACHE_FILE = "data/.form_cache_{form_id}.json"
+
+
+class _LazyJson:
+    """Log argument that is only serialized to JSON if the record is emitted."""
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        buffer = io.BytesIO()
+        json_io.dump(self.obj, buffer)
+        return buffer.getvalue().decode().rstrip("\n")
+
+
+def _build_client() -> httpx.AsyncClient:
+    """
+    Creates the pooled async HTTP client shared by form fetches and submissions.
+    Both Google hosts speak HTTP/2, so concurrent requests are multiplexed over
+    a few kept-alive connections. Failed connection attempts are retried by
+    the transport.
+    """
+    limits = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+    return httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT},
+        follow_redirects=True,
+        timeout=httpx.Timeout(10.0, connect=5.0),
+        transport=httpx.AsyncHTTPTransport(http2=True, retries=3, limits=limits),
+    )
+
+
+async def _run_with_client(func, *args) -> Any:
+    """Runs `func(client, *args)` with a freshly opened client, then closes it."""
+    async with _build_client() as client:
+        return await func(client, *args)
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """
+    Returns how long to wait before retrying `response`: the server's
+    Retry-After when given in seconds, otherwise jittered exponential backoff.
+    """
+    retry_after = response.headers.get("Retry-After", "")
+    try:
+        return min(float(retry_after), RETRY_MAX_DELAY)
+    except ValueError:
+        pass  # missing, or an HTTP-date: fall back to backoff
+
+    backoff = RETRY_BACKOFF * 2**attempt
+    return min(backoff + random.uniform(0, backoff), RETRY_MAX_DELAY)
+
+
+def _should_retry(
+    response: httpx.Response,
+    retry_statuses: frozenset,
+    retry_after_statuses: frozenset,
+) -> bool:
+    """
+    True when `response` is one of `retry_statuses`, or one of
+    `retry_after_statuses` carrying a Retry-After header.
+    """
+    status = response.status_code
+    if status in retry_statuses:
+        return True
+    return status in retry_after_statuses and "Retry-After" in response.headers
+
+
+async def _send_with_retry(
+    client: httpx.AsyncClient,
+    request: httpx.Request,
+    retry_statuses: frozenset = RETRY_STATUSES,
+    retry_after_statuses: frozenset = frozenset(),
+    **send_kwargs: Any,
+) -> httpx.Response:
+    """
+    Sends `request`, retrying up to MAX_RETRIES times while the answer is one
+    of `retry_statuses` (or of `retry_after_statuses` with a Retry-After
+    header). The last response is returned whatever its status.
+    """
+    for attempt in range(MAX_RETRIES):
+        response = await client.send(request, **send_kwargs)
+        if not _should_retry(response, retry_statuses, retry_after_statuses):
+            return response
+
+        await response.aclose()
+        delay = _retry_delay(response, attempt)
+        logger.warning(
+            "Got status %s from %s, retrying in %.1fs (%s/%s)",
+            response.status_code,
+            request.url.host,
+            delay,
+            attempt + 1,
+            MAX_RETRIES,
+        )
+        await asyncio.sleep(delay)
+
+    return await client.send(request, **send_kwargs)
+
+
+def _auth_headers(credentials: Credentials) -> Dict[str, str]:
+    """Builds the Forms API authorization headers for the current access token."""
+    return {"Authorization": f"Bearer {credentials.token}"}
+
+
+def _seconds_until_expiry(credentials: Credentials) -> Optional[float]:
+    """Seconds left before the access token expires, None if it never does."""
+    if credentials.expiry is None:
+        return None
+    # google-auth keeps expiry as a naive UTC datetime
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return (credentials.expiry - now).total_seconds()
+
+
+def _ensure_fresh(credentials: Credentials) -> None:
+    """
+    Refreshes the access token up front instead of on the first failing request.
+    google-auth already reports a token as invalid a few minutes before it
+    expires, so a token that passes is good for the start of a batch.
+    """
+    if not credentials.valid:
+        logger.info("Refreshing expired access token.")
+        credentials.refresh(Request())
+
+
+async def _keep_token_fresh(credentials: Credentials, headers: Dict[str, str]) -> None:
+    """
+    Background task for long batches: refreshes the access token
+    TOKEN_REFRESH_MARGIN seconds before it expires and updates the shared
+    `headers` in place, so in-flight submissions pick up the new token.
+    """
+    while (remaining := _seconds_until_expiry(credentials)) is not None:
+        delay = remaining - TOKEN_REFRESH_MARGIN
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await asyncio.to_thread(credentials.refresh, Request())
+        except Exception as e:
+            logger.error("Token refresh failed: %s", e)
+            return
+        headers.update(_auth_headers(credentials))
+
+
+def _invalidate_form_cache(form_id: str) -> None:
+    """Drops the cached schema and entry mapping so the next submission reloads them."""
+    _FORM_CACHE.pop(form_id, None)
+    invalidate_entry_map(form_id)
+
+    # Later runs must fetch the form again too
+    try:
+        os.remove(FORM_CACHE_FILE.format(form_id=form_id))
+    except FileNotFoundError:
+        pass  # nothing saved
+    except OSError as e:
+        logger.warning("Could not remove the saved form %s: %s", form_id, e)
+
+
+def _load_saved_form(form_id: str) -> Optional[Tuple[Dict[str, Any], float]]:
+    """
+    Returns the form data saved on disk and how many seconds it stays fresh,
+    or None when the file is missing, unreadable or older than FORM_CACHE_TTL.
+    """
+    try:
+        saved = json_io.read(FORM_CACHE_FILE.format(form_id=form_id))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(saved, dict):
+        return None
+    fetched_at, form_data = saved.get("fetched_at"), saved.get("form")
+    if not isinstance(fetched_at, (int, float)) or not isinstance(form_data, dict):
+        return None
+
+    age = time.time() - fetched_at
+    if not 0 <= age < FORM_CACHE_TTL:
+        return None  # stale, or saved with a clock ahead of ours
+    return form_data, FORM_CACHE_TTL - age
+
+
+def save_form_cache(form_id: str, form_data: Dict[str, Any]) -> None:
+    """
+    Saves a fetched form for later runs, restarting its FORM_CACHE_TTL. Also
+    called by read_form.py, so a re-read form replaces the cached copy. Failing
+    to save it is not fatal.
+    """
+    saved = {"fetched_at": time.time(), "form": form_data}
+    try:
+        os.makedirs("data", exist_ok=True)
+        json_io.write_atomic(FORM_CACHE_FILE.format(form_id=form_id), saved, False)
+    except OSError as e:
+        logger.warning("Could not save form %s: %s", form_id, e)
+
+
+async def fetch_form_data_async(
+    client: httpx.AsyncClient,
+    credentials: Credentials,
+    form_id: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Fetches questions from a Google Form using the Google Forms API.
+
+    Args:
+        client (httpx.AsyncClient): The HTTP client used for the request.
+        credentials (Credentials): Authenticated Google OAuth credentials.
+        form_id (str): The Google Form ID.
+        headers (Optional[Dict[str, str]]): Prebuilt authorization headers, shared
+            across a batch. Built from `credentials` when omitted.
+
+    Returns:
+        Dict[str, Any]: The form data as a dictionary, or an error message.
+    """
+    url = f"{FORMS_API_URL}/{form_id}"
+    headers = headers or _auth_headers(credentials)
+
+    try:
+        logger.info("Fetching form questions for Form ID: %s...", form_id)
+        request = client.build_request("GET", url, headers=headers)
+        response = await _send_with_retry(client, request)
+        if response.status_code != 200:
+            logger.error(
+                "Failed to fetch form questions. Status Code: %s", response.status_code
+            )
+            try:
+                return {"error": json_io.loads(response.content)}
+            except ValueError:
+                return {"error": response.text}  # e.g. an HTML error page
+
+        logger.info("Form questions retrieved successfully.")
+        return json_io.loads(response.content)
+
+    except (httpx.HTTPError, ValueError) as e:  # ValueError: body is not JSON
+        logger.error("Request failed: %s", e)
+        return {"error": str(e)}
+
+
+def fetch_form_data(credentials: Credentials, form_id: str) -> Dict[str, Any]:
+    """Blocking wrapper around `fetch_form_data_async` for CLI callers."""
+    return asyncio.run(_run_with_client(fetch_form_data_async, credentials, form_id))
+
+
+async def fetch_forms_bulk(
+    credentials: Credentials, form_ids: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetches several forms concurrently over one pooled client, so every form
+    after the first reuses the same TLS connection and authorization headers.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The form data (or error) of each form ID.
+    """
+    await asyncio.to_thread(_ensure_fresh, credentials)
+    headers = _auth_headers(credentials)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+    async with _build_client() as client:
+
+        async def fetch_one(form_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await fetch_form_data_async(
+                    client, credentials, form_id, headers
+                )
+
+        results = await asyncio.gather(*(fetch_one(form_id) for form_id in form_ids))
+    return dict(zip(form_ids, results))
+
+
+def fetch_forms(
+    credentials: Credentials, form_ids: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """Blocking wrapper around `fetch_forms_bulk` for CLI callers."""
+    return asyncio.run(fetch_forms_bulk(credentials, form_ids))
+
+
+async def _get_form_schema(
+    client: httpx.AsyncClient,
+    credentials: Credentials,
+    form_id: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Tuple[Dict[str, Any], QuestionPlan, str]:
+    """
+    Returns the form data, its question plan and its formResponse URL (empty
+    when the form has no responderUri) from the in-process cache. On a miss, a
+    saved copy younger than FORM_CACHE_TTL is used, and the form is fetched
+    from the Forms API otherwise.
+    """
+    cached = _FORM_CACHE.get(form_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2], cached[3]
+
+    saved = _load_saved_form(form_id)
+    if saved is not None:
+        logger.info("Reusing the saved form data of Form ID: %s", form_id)
+        form_data, ttl = saved
+    else:
+        form_data = await fetch_form_data_async(client, credentials, form_id, headers)
+        ttl = FORM_CACHE_TTL
+        if "error" not in form_data:
+            save_form_cache(form_id, form_data)
+
+    plan = classify_questions(form_data.get("items", []))
+    # Change 'viewform' to 'formResponse'
+    submit_url = form_data.get("responderUri", "").replace(
+        "/viewform", "/formResponse", 1
+    )
+    # Never cache failures, the next submission should retry the fetch
+    if "error" not in form_data:
+        expires_at = time.monotonic() + ttl
+        _FORM_CACHE[form_id] = (expires_at, form_data, plan, submit_url)
+    return form_data, plan, submit_url
+
+
+async def _submit_form_async(
+    client: httpx.AsyncClient,
+    credentials: Credentials,
+    form_id: str,
+    sentiment_level: str,
+    completions: CompletionSession,
+    headers: Optional[Dict[str, str]] = None,
+    sentiment_score: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Fetches Google Form questions, generates answers, and submits the form.
+
+    Args:
+        client (httpx.AsyncClient): The HTTP client used for the requests.
+        credentials: Authenticated Google OAuth credentials.
+        form_id (str): The Google Form ID.
+        sentiment_level (str): "low", "medium" or "high".
+        completions (CompletionSession): The OpenAI session of the batch.
+        headers (Optional[Dict[str, str]]): Prebuilt authorization headers.
+        sentiment_score (Optional[float]): A pre-drawn score for `sentiment_level`,
+            drawn on the spot when omitted.
+
+    Returns:
+        Dict[str, Any]: The outcome of the submission. A successful one also
+            records when it was submitted (UTC) and the sentiment it was
+            answered with.
+    """
+
+    logger.info("Fetching form questions...")
+    form_data, plan, submit_url = await _get_form_schema(
+        client, credentials, form_id, headers
+    )
+
+    if "error" in form_data:
+        return {"success": False, "error": form_data["error"]}  # already logged
+    if not submit_url:
+        logger.warning("No responderUri found in form_data.")
+        return {"success": False, "error": "No responderUri"}
+
+    # Extract the questions array from the JSON
+    questions = form_data.get("items", [])
+
+    #  Randomly assign a sentiment score (0.0 - 1.0) with more weight on higher range
+    if sentiment_score is None:
+        sentiment_score = generate_gaussian_sentiment(sentiment_level)
+    logger.info(
+        "Assigning a sentiment %s with score: %s", sentiment_level, sentiment_score
+    )
+
+    # Build the form fields (e.g., [("usp", "pp_url"), ("entry.XXXX", "answer"), ...]).
+    # Text answers come from OpenAI, all questions are answered concurrently.
+    try:
+        pairs = await agenerate_submission_payload(
+            form_id, questions, sentiment_score, completions, plan
+        )
+    except (OSError, ValueError, OpenAIError) as e:
+        # Missing or incomplete entry data, or OpenAI failed to answer (rate
+        # limit, connection error...): never POST a submission without answers
+        logger.error("Cannot build the submission: %s", e)
+        return {"success": False, "error": str(e)}
+
+    # Answers are form data filled by a bot, keep them out of INFO logs
+    logger.debug("Generated answers: %s", _LazyJson(pairs))
+
+    # POST the answers as an urlencoded body instead of a query string, so long
+    # forms never hit URL length limits
+    logger.debug("Making POST request to: %s", submit_url)
+    try:
+        request = client.build_request(
+            "POST",
+            submit_url,
+            content=urlencode(pairs, quote_via=quote_plus),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        # Only the status matters: stream the response and close it without
+        # downloading the "response recorded" HTML page
+        response = await _send_with_retry(
+            client,
+            request,
+            SUBMIT_RETRY_STATUSES,
+            SUBMIT_RETRY_AFTER_STATUSES,
+            stream=True,
+            follow_redirects=False,
+        )
+        try:
+            logger.debug("Submission answered over %s", response.http_version)
+            # Optional: raise an exception if the status code indicates an error
+            response.raise_for_status()
+        finally:
+            await response.aclose()
+        return {
+            "success": True,
+            "status_code": response.status_code,
+            "submitted_at": datetime.datetime.now(datetime.timezone.utc).isoformat(
+                timespec="seconds"
+            ),
+            "sentiment_level": sentiment_level,
+            "sentiment_score": sentiment_score,
+        }
+    except httpx.HTTPError as e:
+        # A 4xx usually means the form changed: reload schema and mapping next
+        # time. A rate limit does not, and refetching would only add requests.
+        if (
+            isinstance(e, httpx.HTTPStatusError)
+            and e.response.is_client_error
+            and e.response.status_code not in SUBMIT_RETRY_STATUSES
+        ):
+            _invalidate_form_cache(form_id)
+        logger.error("Request error: %s", e, exc_info=True)
+        return {"success": False, "error": str(e)}
+
+
+def submit_form(
+    credentials: Credentials, form_id: str, sentiment_level: str
+) -> Dict[str, Any]:
+    """
+    Blocking wrapper around a single submission, kept for CLI callers. It goes
+    through submit_forms_bulk, so it shares the token refresh and client setup.
+    """
+    return asyncio.run(submit_forms_bulk(credentials, form_id, 1, sentiment_level))[0]
+
+
+async def submit_forms_bulk(
+    credentials: Credentials,
+    form_id: str,
+    n: int,
+    sentiment_level: str = "medium",
+    concurrency: int = MAX_CONCURRENT_SUBMISSIONS,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    answer_cache: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Submits the form `n` times concurrently over a single pooled client.
+
+    At most `concurrency` submissions are in flight at once. The access token is
+    refreshed once before the batch and then kept fresh in the background, so
+    every request reuses the same authorization headers. `on_result`, if given,
+    is called with each result as soon as its submission completes. Without
+    `answer_cache`, text questions are always asked to OpenAI again.
+
+    Returns:
+        List[Dict[str, Any]]: One submission result per attempt, in launch order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # One sentiment score per submission, drawn in a single batch
+    sentiment_scores = [float(score) for score in sentiment_batch(sentiment_level, n)]
+
+    await asyncio.to_thread(_ensure_fresh, credentials)
+    headers = _auth_headers(credentials)
+    refresher = asyncio.create_task(_keep_token_fresh(credentials, headers))
+
+    # The OpenAI client lives as long as the batch, and is closed with it
+    completions = CompletionSession(answer_cache)
+
+    try:
+        async with _build_client() as client, completions:
+            # Fetch the schema once up front: submissions starting together would
+            # otherwise all miss the cache and each fetch the form. This also
+            # opens the connection every submission then reuses.
+            form_data, _, submit_url = await _get_form_schema(
+                client, credentials, form_id, headers
+            )
+            if "error" in form_data or not submit_url:
+                # Nothing can be submitted: fail every attempt without refetching
+                error = form_data.get("error", "No responderUri")
+                logger.error("Cannot submit form %s: %s", form_id, error)
+                failures = [{"success": False, "error": error} for _ in range(n)]
+                if on_result is not None:
+                    for failure in failures:
+                        on_result(failure)
+                return failures
+
+            async def _bounded_submit(sentiment_score: float) -> Dict[str, Any]:
+                async with semaphore:
+                    result = await _submit_form_async(
+                        client,
+                        credentials,
+                        form_id,
+                        sentiment_level,
+                        completions,
+                        headers,
+                        sentiment_score,
+                    )
+                if on_result is not None:
+                    on_result(result)
+                return result
+
+            return await asyncio.gather(
+                *(_bounded_submit(score) for score in sentiment_scores)
+            )
+    finally:
+        refresher.cancel()
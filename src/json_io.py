@@ -0,0 +1,74 @@
+"""
+JSON encoding shared by the scripts and the payload builder: orjson when it is
+installed, the stdlib json module otherwise. Both produce the same UTF-8 bytes.
+"""
+
+import io
+import os
+
+from typing import Any, BinaryIO
+
+try:
+    import orjson
+except ImportError:  # orjson is optional here, fall back to the stdlib encoder
+    import json
+
+    orjson = None  # type: ignore[assignment]
+
+# One buffer holds a whole form/entry file, so each is read or written in one call
+IO_BUFFER_SIZE = 1 << 20
+
+
+def loads(raw: bytes) -> Any:
+    """Parses a JSON document from bytes."""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def dumps_line(data: Any) -> bytes:
+    """Serializes `data` as one compact JSON line, ending with a newline."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return text.encode("utf-8") + b"\n"
+
+
+def dump(data: Any, file: BinaryIO, pretty: bool = True) -> None:
+    """
+    Writes `data` to the binary `file` as JSON ending with a newline, indented
+    when `pretty` and compact otherwise.
+    """
+    if orjson is not None:
+        option = orjson.OPT_APPEND_NEWLINE
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        file.write(orjson.dumps(data, option=option))
+        return
+
+    # The stdlib encoder streams its chunks through the file buffer instead of
+    # building the whole document as one string first. Non-ASCII titles are
+    # written as UTF-8 (like orjson), not as \uXXXX escapes.
+    text_file = io.TextIOWrapper(file, encoding="utf-8")
+    if pretty:
+        json.dump(data, text_file, ensure_ascii=False, indent=2)
+    else:
+        json.dump(data, text_file, ensure_ascii=False, separators=(",", ":"))
+    text_file.write("\n")
+    text_file.flush()
+    text_file.detach()  # leave `file` open for its owner to close
+
+
+def read(filename: str) -> Any:
+    """Parses the JSON file `filename`, read in a single call."""
+    with open(filename, "rb", buffering=IO_BUFFER_SIZE) as file:
+        return loads(file.read())
+
+
+def write_atomic(filename: str, data: Any, pretty: bool = True) -> None:
+    """
+    Writes `data` to a temp file next to `filename` and swaps it in, so a crash
+    mid-write never leaves a truncated file behind.
+    """
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "wb", buffering=IO_BUFFER_SIZE) as file:
+        dump(data, file, pretty)
+    os.replace(tmp_filename, filename)
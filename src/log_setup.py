@@ -0,0 +1,22 @@
+"""
+Logging setup shared by the command-line scripts.
+"""
+
+import os
+import logging
+
+
+def configure_logging() -> None:
+    """
+    Configures the root logger from the LOG_LEVEL environment variable
+    (INFO by default, unknown names fall back to INFO) and quiets the HTTP stack.
+    """
+    # e.g. LOG_LEVEL=DEBUG to also see the debug messages of every module
+    log_level = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        level=log_level if isinstance(log_level, int) else logging.INFO,
+    )
+    # The HTTP stack logs every request and connection event, keep it quiet
+    for noisy_logger in ("httpx", "httpcore", "hpack"):
+        logging.getLogger(noisy_logger).setLevel(logging.WARNING)
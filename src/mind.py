@@ -1,42 +1,254 @@
 import os
+import re
 import string
 import random
-from typing import Dict, Any, List, Optional
-
-from openai import OpenAI
+import asyncio
+import hashlib
+import sqlite3
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import numpy as np
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
 from config import (
     AI_PROMPT,
+    ANSWER_CACHE_FILE,
+    OPENAI_MODEL,
     SKIP_WORDS,
     SKIP_PHRASES,
     IGNORE_SENTIMENT_QUESTIONS,
     PREDEFINED_VALUES,
 )
 
-
 # Loads environment variables from a .env file into your shell’s environment.
 # Make sure you have a .env file at the project’s root (or specify the path).
 load_dotenv()
 
 
+def require_openai_key() -> str:
+    """
+    Returns the OpenAI API key, checked when the first completion is requested
+    and by the CLI before a run.
+    Raises RuntimeError, not ValueError: callers skip questions on ValueError,
+    and a missing key must stop the run instead.
+    """
+    openai_key = os.getenv("OPENAI_API_KEY")
+    if not openai_key:
+        raise RuntimeError("OPENAI_API_KEY not found in .env file.")
+    return openai_key
+
+
+# Upper bound of OpenAI requests in flight at once on the async path
+MAX_CONCURRENT_COMPLETIONS = 20
+
+
+class CompletionSession:
+    """
+    The OpenAI client, request limit and in-flight completions of one bulk run,
+    used as `async with CompletionSession() as completions:`. The client is
+    created on the first completion and closed when the block exits. Without
+    `answer_cache`, completions are neither read from nor saved to the
+    persistent answer cache, so every question is asked again.
+    """
+
+    def __init__(self, answer_cache: bool = True) -> None:
+        self._client: Optional[AsyncOpenAI] = None
+        self.cache: Optional[_AnswerCache] = _ANSWER_CACHE if answer_cache else None
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_COMPLETIONS)
+        # cache key -> the completion task answering it, so identical questions
+        # asked concurrently share one request. Only used with the answer cache,
+        # whose answers are shared by every submission anyway.
+        self.in_flight: Dict[str, "asyncio.Task[str]"] = {}
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(api_key=require_openai_key())
+        return self._client
+
+    async def __aenter__(self) -> "CompletionSession":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+# Shared random generator for the choice, scale and matrix strategies, also
+# drawing the sentiment scores in app.py
+RNG = np.random.default_rng()
+
+
+def _pick(values: List[Any]) -> Any:
+    """Returns one random element of `values`, drawn from the shared generator."""
+    return values[int(RNG.integers(len(values)))]
+
+
+# Every skip phrase in one alternation, so a title is scanned once for all of them
+_SKIP_RE = re.compile(
+    "|".join(map(re.escape, SKIP_PHRASES)) or r"(?!)",  # no phrases: never match
+    re.IGNORECASE,
+)
+
+
+def _sentiment_bucket(sentiment_score: float) -> int:
+    """Discretizes a sentiment score: 0 for low, 1 for medium, 2 for high."""
+    if sentiment_score < 0.33:
+        return 0
+    elif sentiment_score < 0.66:
+        return 1
+    return 2
+
+
+# The sentiment sub-ranges only depend on the number of values and the bucket, the
+# helpers below return them as (start, stop) slice bounds, memoized per pair.
+
+
+@lru_cache(maxsize=256)
+def _choice_range(num_choices: int, bucket: int) -> Tuple[int, int]:
+    # Calculate cutoffs for overlapping ranges
+    low_cutoff = max(2, num_choices // 3)  # Ensures at least 2 values in low
+    medium_cutoff = (2 * num_choices) // 3  # Mid cutoff
+
+    # Overlapping segments for smoother sentiment transitions
+    if bucket == 0:
+        return 0, medium_cutoff  # Covers first third + one from medium
+    elif bucket == 1:
+        return low_cutoff, medium_cutoff  # Properly centered medium range
+    return medium_cutoff, num_choices  # Covers last third
+
+
+@lru_cache(maxsize=256)
+def _scale_range(num_values: int, bucket: int) -> Tuple[int, int]:
+    # Compute segment cutoffs for overlapping ranges
+    low_cutoff = max(1, num_values // 3)
+    medium_cutoff = (2 * num_values) // 3
+
+    # Define overlapping sentiment ranges
+    if bucket == 0:
+        return 0, medium_cutoff  # Covers 1st and 2nd thirds
+    elif bucket == 1:
+        return low_cutoff, medium_cutoff + 1  # Covers 2nd and 3rd thirds
+    return medium_cutoff, num_values  # Covers last third
+
+
+@lru_cache(maxsize=256)
+def _matrix_range(num_choices: int, bucket: int) -> Tuple[int, int]:
+    # Determine sentiment category cutoffs
+    low_cutoff = max(1, num_choices // 3)
+    medium_cutoff = (2 * num_choices) // 3
+
+    if bucket == 0:
+        return 0, low_cutoff  # Low sentiment
+    elif bucket == 1:
+        return low_cutoff, medium_cutoff  # Medium sentiment
+    return medium_cutoff, num_choices  # High sentiment
+
+
+def _option_norm(option: Dict[str, Any]) -> str:
+    """
+    Returns the stripped, lowercased value of a choice option. It is memoized on
+    the option itself, as the same form is answered once per submission.
+    """
+    norm = option.get("_norm")
+    if norm is None:
+        norm = option["_norm"] = option["value"].strip().lower()
+    return norm
+
+
+class _AnswerCache:
+    """
+    Persistent cache of raw OpenAI completions, keyed by a hash of the prompt,
+    the question text and the model. A per-process dict sits in front of the
+    SQLite table; the database is opened on first use.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._memory: Dict[str, str] = {}
+        self._db: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def key(question_text: str) -> str:
+        raw_key = f"{AI_PROMPT}\n{question_text}\n{OPENAI_MODEL}"
+        return hashlib.sha256(raw_key.encode()).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            # Autocommit: every stored completion is durable right away
+            self._db = sqlite3.connect(self._path, isolation_level=None)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions "
+                "(key TEXT PRIMARY KEY, completion TEXT NOT NULL)"
+            )
+        return self._db
+
+    def get(self, key: str) -> Optional[str]:
+        if key not in self._memory:
+            row = (
+                self._connection()
+                .execute("SELECT completion FROM completions WHERE key = ?", (key,))
+                .fetchone()
+            )
+            if row is None:
+                return None
+            self._memory[key] = row[0]
+        return self._memory[key]
+
+    def set(self, key: str, completion: str) -> None:
+        self._memory[key] = completion
+        self._connection().execute(
+            "INSERT OR REPLACE INTO completions VALUES (?, ?)", (key, completion)
+        )
+
+
+_ANSWER_CACHE = _AnswerCache(ANSWER_CACHE_FILE)
+
+
+# A strategy answers with one response, or one per row for a matrix/grid question
+Answer = Union[Dict[str, Any], List[Dict[str, Any]]]
+
+
 class AnswerStrategy:
     """Abstract base class for answer generation strategies."""
 
-    def generate_answer(
+    async def agenerate_answer(
+        self,
+        question: Dict[str, Any],
+        sentiment_score: float,
+        completions: CompletionSession,
+    ) -> Answer:
+        """
+        Generates a structured response dictionary for `question`. Strategies
+        that ask OpenAI go through the run's `completions` session.
+        """
+        raise NotImplementedError
+
+
+class _LocalAnswerStrategy(AnswerStrategy):
+    """Base of the strategies that answer with CPU work alone, without awaiting."""
+
+    def _generate_answer(
         self, question: Dict[str, Any], sentiment_score: float
-    ) -> Dict[str, Any]:
-        """Generates a structured response dictionary."""
+    ) -> Answer:
         raise NotImplementedError
 
+    async def agenerate_answer(
+        self,
+        question: Dict[str, Any],
+        sentiment_score: float,
+        completions: CompletionSession,
+    ) -> Answer:
+        return self._generate_answer(question, sentiment_score)
+
 
 class TextAnswerStrategy(AnswerStrategy):
     """Handles free-text question answers."""
 
-    OPENAI_KEY = os.getenv("OPENAI_API_KEY")
-    if not OPENAI_KEY:
-        raise ValueError("OPENAI_API_KEY not found in .env file.")
-
     def _process_generated_answer(self, text: str) -> str:
         """
 
@@ -55,17 +267,15 @@ class TextAnswerStrategy(AnswerStrategy):
         if not words:
             return ""  # Return empty string if no words are present
 
-        # Randomly shuffle words
-        random.shuffle(words)
-
-        # Select a random number of words (min 1, max 5)
+        # Select a random number of words (min 1, max 5), in random order
         num_words = random.randint(1, min(4, len(words)))
-        selected_words = words[:num_words]
+        selected_words = random.sample(words, num_words)
 
-        # Randomly capitalize the first letter of some words
+        # Randomly capitalize the first letter of some words, one bit per word
+        capitalize_mask = random.getrandbits(num_words)
         randomized_words = [
-            word.capitalize() if random.choice([True, False]) else word.lower()
-            for word in selected_words
+            word.capitalize() if (capitalize_mask >> i) & 1 else word.lower()
+            for i, word in enumerate(selected_words)
         ]
 
         # Join words back into a single string
@@ -77,52 +287,97 @@ class TextAnswerStrategy(AnswerStrategy):
 
         return result
 
-    def _get_predefined_answer(self, question_text: str) -> Optional[str]:
+    def _get_predefined_answer(self, question_lower: str) -> Optional[str]:
         """Check if the question matches any predefined keys and return a random value."""
         for key, values in PREDEFINED_VALUES.items():
-            if key.lower() in question_text.lower():
+            if key.lower() in question_lower:
                 return random.choice(values)
         return None
 
-    def _generate_openai_answer(self, question_text: str) -> str:
-        """Generates an answer using OpenAI."""
-        client = OpenAI(api_key=self.OPENAI_KEY)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": f"{AI_PROMPT}\n\n{question_text}"}],
-        )
-        # make it more natural, trim and capitalize
-        processed_answer = self._process_generated_answer(
-            response.choices[0].message.content
-        )
-        return processed_answer
-
-    def generate_answer(
-        self, question: Dict[str, Any], sentiment_score: float
+    async def _arequest_completion(
+        self, completions: CompletionSession, cache_key: str, question_text: str
+    ) -> str:
+        """
+        Requests a completion from OpenAI and stores it in the answer cache,
+        unless it yields no answer.
+        """
+        async with completions.semaphore:
+            response = await completions.client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "user", "content": f"{AI_PROMPT}\n\n{question_text}"}
+                ],
+            )
+        # A refused or empty completion has no content
+        completion = response.choices[0].message.content or ""
+        # Only cache a usable answer, so an empty one is asked for again next time
+        if completions.cache is not None and self._process_generated_answer(completion):
+            completions.cache.set(cache_key, completion)
+        return completion
+
+    async def _agenerate_openai_answer(
+        self, completions: CompletionSession, question_text: str
+    ) -> str:
+        """Generates an answer using OpenAI, without blocking the event loop."""
+        cache_key = _AnswerCache.key(question_text)
+        cache = completions.cache
+        completion = cache.get(cache_key) if cache is not None else None
+        if cache is None:
+            # No cache: every submission asks OpenAI for its own completion
+            completion = await self._arequest_completion(
+                completions, cache_key, question_text
+            )
+        elif completion is None:
+            in_flight = completions.in_flight
+            task = in_flight.get(cache_key)
+            if task is None:
+                # First ask of this question: later duplicates await this task
+                task = asyncio.ensure_future(
+                    self._arequest_completion(completions, cache_key, question_text)
+                )
+                in_flight[cache_key] = task
+                task.add_done_callback(lambda _: in_flight.pop(cache_key, None))
+            # Shielded, so one cancelled caller does not cancel the shared request
+            completion = await asyncio.shield(task)
+
+        # make it more natural, trim and capitalize (differs on every call)
+        return self._process_generated_answer(completion)
+
+    def _is_skipped(self, question_lower: str) -> bool:
+        """Some questions (e.g. optional ones, emails) are left unanswered."""
+        return _SKIP_RE.search(question_lower) is not None
+
+    async def agenerate_answer(
+        self,
+        question: Dict[str, Any],
+        sentiment_score: float,
+        completions: CompletionSession,
     ) -> Dict[str, Any]:
-        question_id = question["questionItem"]["question"]["questionId"]
         question_text = question["title"].strip()
+        question_lower = question_text.lower()
 
         # 1) Skip some questions
-        if any(skip_phrase in question_text.lower() for skip_phrase in SKIP_PHRASES):
+        if self._is_skipped(question_lower):
             return {}
 
         # 2) Try to get a predefined answer
-        generated_answer = self._get_predefined_answer(question_text)
+        generated_answer = self._get_predefined_answer(question_lower)
 
         # 3) Otherwise, use OpenAI to generate an answer
         if not generated_answer:
-            generated_answer = self._generate_openai_answer(question_text)
+            generated_answer = await self._agenerate_openai_answer(
+                completions, question_text
+            )
 
         return {
             "entryId": "<TO ADD>",
-            "questionId": question_id,
+            "questionId": question["questionItem"]["question"]["questionId"],
             "question_title": question_text,
             "answers": [generated_answer],
         }
 
 
-class ChoiceAnswerStrategy(AnswerStrategy):
+class ChoiceAnswerStrategy(_LocalAnswerStrategy):
     """Handles multiple-choice (checkbox, radio, dropdown) question answers."""
 
     def _get_choices_based_on_sentiment(self, choice_values, sentiment_score):
@@ -137,38 +392,22 @@ class ChoiceAnswerStrategy(AnswerStrategy):
         if num_choices == 0:
             return []  # Edge case: No choices available
 
-        # Calculate cutoffs for overlapping ranges
-        low_cutoff = max(2, num_choices // 3)  # Ensures at least 2 values in low
-        medium_cutoff = (2 * num_choices) // 3  # Mid cutoff
-
-        # Overlapping segments for smoother sentiment transitions
-        low_range = choice_values[
-            :medium_cutoff
-        ]  # Covers first third + one from medium
-        medium_range = choice_values[
-            low_cutoff:medium_cutoff
-        ]  # Properly centered medium range
-        high_range = choice_values[medium_cutoff:]  # Covers last third
-
-        # Assign ranges dynamically
-        if sentiment_score < 0.33:
-            return low_range  # Low sentiment gets broader choices
-        elif sentiment_score < 0.66:
-            return medium_range  # Medium sentiment properly centered
-        else:
-            return high_range  # High sentiment remains higher values
+        # Low sentiment gets broader choices, medium is properly centered and
+        # high remains higher values
+        start, stop = _choice_range(num_choices, _sentiment_bucket(sentiment_score))
+        return choice_values[start:stop]
 
-    def generate_answer(
+    def _generate_answer(
         self, question: Dict[str, Any], sentiment_score: float
     ) -> Dict[str, Any]:
         question_id = question["questionItem"]["question"]["questionId"]
-        question_text = question["title"]
+        question_text = question["title"].strip()
         choices = question["questionItem"]["question"]["choiceQuestion"]["options"]
 
         choice_values = [
             choice["value"]
             for choice in choices
-            if "value" in choice and choice["value"].strip().lower() not in SKIP_WORDS
+            if "value" in choice and _option_norm(choice) not in SKIP_WORDS
         ]
 
         # Determine if single-choice (RADIO, DROPDOWN) or multiple-choice (CHECKBOX)
@@ -177,7 +416,6 @@ class ChoiceAnswerStrategy(AnswerStrategy):
         )
 
         if question_type == "CHECKBOX":  # Multiple selections allowed
-            random.shuffle(choice_values)  # Shuffle before sampling
             min_choices = min(
                 2, len(choice_values)
             )  # Ensure it does not exceed available choices
@@ -185,22 +423,22 @@ class ChoiceAnswerStrategy(AnswerStrategy):
                 min_choices, int(len(choice_values) * 0.6)
             )  # Ensure valid range
 
-            num_choices = random.randint(
-                min_choices, max_choices
+            num_choices = int(
+                RNG.integers(min_choices, max_choices + 1)
             )  # Guaranteed valid range
-            answers = random.sample(choice_values, num_choices)
+            # Sampled without replacement, already in random order
+            picked = RNG.choice(len(choice_values), size=num_choices, replace=False)
+            answers = [choice_values[i] for i in picked]
         else:
-            if any(
-                q.lower() in question_text.lower().split()
-                for q in IGNORE_SENTIMENT_QUESTIONS
-            ):
+            question_words = set(question_text.lower().split())
+            if question_words & IGNORE_SENTIMENT_QUESTIONS:
                 possible_choices = choice_values
             else:
                 possible_choices = (
                     self._get_choices_based_on_sentiment(choice_values, sentiment_score)
                     or choice_values
                 )
-            answers = [random.choice(possible_choices)]
+            answers = [_pick(possible_choices)]
 
         return {
             "entryId": "<TO ADD>",
@@ -210,7 +448,7 @@ class ChoiceAnswerStrategy(AnswerStrategy):
         }
 
 
-class ScaleAnswerStrategy(AnswerStrategy):
+class ScaleAnswerStrategy(_LocalAnswerStrategy):
     """Handles scale-based (linear scale) question answers."""
 
     def _get_values_based_on_sentiment(
@@ -231,39 +469,15 @@ class ScaleAnswerStrategy(AnswerStrategy):
                 f"Invalid scale range: {low} to {high} in question '{question_text}'"
             )
 
-        # Generate the full range of scale values
-        scale_range = list(range(low, high + 1))  # Inclusive range
-        num_values = len(scale_range)
-
-        # Compute segment cutoffs for overlapping ranges
-        low_cutoff = max(1, num_values // 3)
-        medium_cutoff = (2 * num_values) // 3
-
-        # Define overlapping sentiment ranges
-        low_range = scale_range[:medium_cutoff]  # Covers 1st and 2nd thirds
-        medium_range = scale_range[
-            low_cutoff : medium_cutoff + 1
-        ]  # Covers 2nd and 3rd thirds
-        high_range = scale_range[medium_cutoff:]  # Covers last third
-
-        # Select appropriate range based on sentiment score
-        if sentiment_score < 0.33:
-            possible_values = low_range
-        elif sentiment_score < 0.66:
-            possible_values = medium_range
-        else:
-            possible_values = high_range
-
-        # Shuffle for better distribution before selecting
-        random.shuffle(possible_values)
-
-        return possible_values
+        # Select the appropriate range of the (inclusive) scale based on sentiment
+        start, stop = _scale_range(high - low + 1, _sentiment_bucket(sentiment_score))
+        return list(range(low + start, low + stop))
 
-    def generate_answer(
+    def _generate_answer(
         self, question: Dict[str, Any], sentiment_score: float
     ) -> Dict[str, Any]:
         question_id = question["questionItem"]["question"]["questionId"]
-        question_text = question["title"]
+        question_text = question["title"].strip()
         scale = question["questionItem"]["question"]["scaleQuestion"]
         low, high = scale["low"], scale["high"]
 
@@ -276,53 +490,38 @@ class ScaleAnswerStrategy(AnswerStrategy):
             "entryId": "<TO ADD>",
             "questionId": question_id,
             "question_title": question_text,
-            "answers": [str(random.choice(possible_values))],
+            "answers": [str(_pick(possible_values))],
         }
 
 
-class MatrixAnswerStrategy(AnswerStrategy):
+class MatrixAnswerStrategy(_LocalAnswerStrategy):
     """Handles matrix/grid questions where each row has a single selection."""
 
-    def _get_matrix_choice_based_on_sentiment(
+    def _get_matrix_choices_based_on_sentiment(
         self, choice_values: List[Any], sentiment_score: float
-    ) -> Any:
+    ) -> List[Any]:
         """
-        Selects a matrix answer choice based on sentiment.
+        Selects the matrix answer choices matching a sentiment. They only depend
+        on the columns and the score, so they are shared by every row.
 
         :param choice_values: Sorted list of available choices.
         :param sentiment_score: Sentiment score between 0.0 and 1.0.
-        :return: A single choice based on sentiment.
+        :return: The choices a row may pick from, never empty.
         """
         num_choices = len(choice_values)
         if num_choices == 0:
             raise ValueError("No available choices for matrix question.")
 
-        # Determine sentiment category cutoffs
-        low_cutoff = max(1, num_choices // 3)
-        medium_cutoff = (2 * num_choices) // 3
-
         # Assign choices based on sentiment
-        if sentiment_score < 0.33:
-            possible_choices = choice_values[:low_cutoff]  # Low sentiment
-        elif sentiment_score < 0.66:
-            possible_choices = choice_values[
-                low_cutoff:medium_cutoff
-            ]  # Medium sentiment
-        else:
-            possible_choices = choice_values[medium_cutoff:]  # High sentiment
+        start, stop = _matrix_range(num_choices, _sentiment_bucket(sentiment_score))
+        possible_choices = choice_values[start:stop]
 
         # Ensure a valid choice is always selected
-        return (
-            random.choice(possible_choices)
-            if possible_choices
-            else random.choice(choice_values)
-        )
+        return possible_choices or choice_values
 
-    def generate_answer(
+    def _generate_answer(
         self, question: Dict[str, Any], sentiment_score: float
     ) -> List[Dict[str, Any]]:
-        responses = []
-
         grid_data = question.get("questionGroupItem", {})
         questions = grid_data.get("questions", [])
         columns = grid_data.get("grid", {}).get("columns", {}).get("options", [])
@@ -332,24 +531,36 @@ class MatrixAnswerStrategy(AnswerStrategy):
 
         # Extract column choices
         choice_values = [option["value"] for option in columns]
+        possible_choices = self._get_matrix_choices_based_on_sentiment(
+            choice_values, sentiment_score
+        )
+        # Draw the answer of every row at once
+        picked = RNG.integers(len(possible_choices), size=len(questions))
 
         # Generate a random answer for each row in the matrix
-        for row in questions:
-            row_question_id = row["questionId"]
-            chosen_answer = self._get_matrix_choice_based_on_sentiment(
-                choice_values, sentiment_score
-            )
+        return [
+            {
+                "entryId": "<TO ADD>",
+                "questionId": row["questionId"],
+                "question_title": row["rowQuestion"]["title"].strip(),
+                "answers": [possible_choices[choice_index]],
+            }
+            for row, choice_index in zip(questions, picked)
+        ]
 
-            responses.append(
-                {
-                    "entryId": "<TO ADD>",
-                    "questionId": row_question_id,
-                    "question_title": row["rowQuestion"]["title"],
-                    "answers": [chosen_answer],
-                }
-            )
 
-        return responses
+# Strategies are stateless, one shared instance of each serves every question
+_TEXT = TextAnswerStrategy()
+_CHOICE = ChoiceAnswerStrategy()
+_SCALE = ScaleAnswerStrategy()
+_MATRIX = MatrixAnswerStrategy()
+
+# questionItem.question key -> strategy, checked in this order
+_QUESTION_STRATEGIES = {
+    "textQuestion": _TEXT,
+    "choiceQuestion": _CHOICE,
+    "scaleQuestion": _SCALE,
+}
 
 
 class AnswerStrategyFactory:
@@ -359,13 +570,10 @@ class AnswerStrategyFactory:
     def get_strategy(question: Dict[str, Any]) -> AnswerStrategy:
         question_data = question.get("questionItem", {}).get("question", {})
 
-        if "textQuestion" in question_data:
-            return TextAnswerStrategy()
-        elif "choiceQuestion" in question_data:
-            return ChoiceAnswerStrategy()
-        elif "scaleQuestion" in question_data:
-            return ScaleAnswerStrategy()
-        elif "questionGroupItem" in question:
-            return MatrixAnswerStrategy()
+        for question_type, strategy in _QUESTION_STRATEGIES.items():
+            if question_type in question_data:
+                return strategy
+        if "questionGroupItem" in question:
+            return _MATRIX
 
         raise ValueError("Unknown question type")
@@ -1,53 +1,118 @@
-import json
+import os
 import logging
 import argparse
 
-from app import fetch_form_data, gather_entry_data_init
-from auth import authenticate
+from functools import lru_cache
+from typing import Dict, List
+
+import json_io
+
+from log_setup import configure_logging
 
 logger = logging.getLogger(__name__)
 
 
-def main():
-    logging.basicConfig(
-        format="%(asctime)s - %(levelname)s - %(message)s", level=logging.DEBUG
-    )
+def _load_entry_data(entry_data_filename: str) -> dict:
+    """Loads the existing entry_data (the large mapping file), if present."""
+    try:
+        return json_io.read(entry_data_filename)
+    except FileNotFoundError:
+        return {}  # start with an empty dict if it doesn't exist
+
+
+def _save_form(
+    form_id: str, form_data: dict, entry_data: dict, pretty: bool = False
+) -> None:
+    """
+    Saves the fetched form, and creates its entry mapping if missing. The form
+    data is compact unless `pretty`; the entry mapping is always indented, as
+    it is edited by hand. A failed fetch saves nothing, so the next run fetches
+    the form again.
+    """
+    if "error" in form_data:
+        logger.error("Failed to fetch form %s: %s", form_id, form_data["error"])
+        return
 
+    from app import gather_entry_data_init
+    from forms_client import save_form_cache
+
+    filename = f"data/form_data_{form_id}.json"
+    json_io.write_atomic(filename, form_data, pretty)
+    logger.info("Form data %s saved to %s", form_id, filename)
+    # submit_form.py must not keep submitting against an older cached copy
+    save_form_cache(form_id, form_data)
+
+    # If we don't already have an entry for this form_id, create one
+    if form_id not in entry_data:
+        entry_data_filename = f"data/entry_data_{form_id}.json"
+        entry_data[form_id] = gather_entry_data_init(form_data)
+        json_io.write_atomic(entry_data_filename, entry_data)
+        logger.info("Entry data for form %s saved to %s", form_id, entry_data_filename)
+
+
+@lru_cache(maxsize=1)
+def _build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser once; its shape never changes."""
     parser = argparse.ArgumentParser(description="Fetch Google Form Questions via API")
     parser.add_argument(
-        "--form-id", required=True, help="Google Form ID to fetch questions from"
+        "--form-id",
+        nargs="+",
+        required=True,
+        help="One or more Google Form IDs to fetch questions from",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Fetch the form again even if its data was already saved",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Indent the saved form data, for reading it",
+    )
+    return parser
+
+
+def main():
+    configure_logging()
+
+    args = _build_parser().parse_args()
+
+    # 1) Load the entry data of every form, and work out which ones need fetching
+    entry_data_by_form: Dict[str, dict] = {}
+    for form_id in dict.fromkeys(args.form_id):  # drop duplicates, keep order
+        entry_data = _load_entry_data(f"data/entry_data_{form_id}.json")
+        filename = f"data/form_data_{form_id}.json"
+
+        # Both files already exist, nothing to fetch
+        if not args.force and form_id in entry_data and os.path.exists(filename):
+            logger.info(
+                "Form %s already saved to %s, use --force to fetch it again",
+                form_id,
+                filename,
+            )
+            continue
+        entry_data_by_form[form_id] = entry_data
+
+    if not entry_data_by_form:
+        return
+
+    # Imported only when a form has to be fetched, so --help, usage errors and
+    # already saved forms skip loading the Google auth and HTTP stacks
+    from forms_client import fetch_forms
+    from auth import authenticate
 
-    form_id: str = args.form_id
-   
     credentials = authenticate()
     if not credentials:
         logger.error("Authentication failed. Exiting script.")
         return
 
-    # 1) Fetch the form data (the JSON you showed)
-    form_data = fetch_form_data(credentials, form_id)
-    filename = f"data/form_data_{form_id}.json"
-    with open(filename, "w") as file:
-        json.dump(form_data, file, indent=4)
-        logger.info(f"Form data {form_id} saved to {filename}")
-
-    # 2) Load the existing entry_data (the large mapping file), if present
-    entry_data_filename = f"data/entry_data_{form_id}.json"
-    try:
-        with open(entry_data_filename, "r") as f:
-            entry_data = json.load(f)
-    except FileNotFoundError:
-        entry_data = {}  # start with an empty dict if it doesn't exist
-
-    # 3) If we don't already have an entry for this form_id, create one
-    if form_id not in entry_data:
-        entry_data[form_id] = gather_entry_data_init(form_data)
-        # 4) Save the updated entry_data
-        with open(entry_data_filename, "w") as file:
-            json.dump(entry_data, file, indent=4)
-        logger.info(f"Entry data for form {form_id} saved to {entry_data_filename}")
+    # 2) Fetch all the forms concurrently, then save each one
+    os.makedirs("data", exist_ok=True)
+    form_ids: List[str] = list(entry_data_by_form)
+    forms = fetch_forms(credentials, form_ids)
+    for form_id in form_ids:
+        _save_form(form_id, forms[form_id], entry_data_by_form[form_id], args.pretty)
 
 
 if __name__ == "__main__":
@@ -1,21 +1,47 @@
+import os
+import asyncio
 import logging
 import argparse
 
-from app import submit_form
-from auth import authenticate
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import json_io
+
+from config import MAX_CONCURRENT_SUBMISSIONS
+from log_setup import configure_logging
 
 logger = logging.getLogger(__name__)
 
 
-def main():
-    logging.basicConfig(
-        format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO
-    )
+def _log_result(submission_result: Dict[str, Any]) -> None:
+    """Logs the outcome of one submission, as soon as it completes."""
+    if submission_result.get("success"):
+        logger.info("Emulated submission completed!")
+    else:
+        logger.error(
+            "Emulated submission failed. Reason: %s", submission_result.get("error")
+        )
+
+
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
 
+
+@lru_cache(maxsize=1)
+def _build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser once; its shape never changes."""
     parser = argparse.ArgumentParser(description="Emulate a Google Form submission")
     parser.add_argument("--form-id", required=True, help="Google Form ID")
     parser.add_argument(
-        "--repeat", type=int, default=1, help="Repeat the submission (default: 1)"
+        "--repeat",
+        type=_positive_int,
+        default=1,
+        help="Repeat the submission (default: 1)",
     )
     parser.add_argument(
         "--sentiment",
@@ -24,11 +50,48 @@ def main():
         default="medium",
         help="Set the sentiment level (default: medium)",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--concurrency",
+        type=_positive_int,
+        default=None,
+        help=f"Submissions in flight at once (default: {MAX_CONCURRENT_SUBMISSIONS})",
+    )
+    parser.add_argument(
+        "--no-answer-cache",
+        dest="answer_cache",
+        action="store_false",
+        help="Ask OpenAI again instead of reusing the cached text answers",
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Runs the CLI. `argv` defaults to sys.argv[1:]; drivers can pass their own
+    arguments to submit forms in-process, without a new interpreter.
+    """
+    configure_logging()
+
+    args = _build_parser().parse_args(argv)
+
+    # Imported only once the arguments are valid, so --help and usage errors
+    # skip loading the Google auth, HTTP and OpenAI stacks
+    from forms_client import submit_forms_bulk
+    from auth import authenticate
+    from mind import require_openai_key
+
+    # Text answers need OpenAI, fail before submitting anything without them
+    try:
+        require_openai_key()
+    except RuntimeError as e:
+        logger.error("%s Exiting script.", e)
+        return
 
     form_id: str = args.form_id
     repeat_no: int = args.repeat
     sentiment_level = args.sentiment
+    # More workers than submissions would only sit idle
+    concurrency: int = min(repeat_no, args.concurrency or MAX_CONCURRENT_SUBMISSIONS)
 
     credentials = authenticate()  # Replace with your real auth routine
 
@@ -36,15 +99,49 @@ def main():
         logger.error("Authentication failed. Exiting script.")
         return
 
-    # Attempt the submission the specified number of times
-    for idx in range(repeat_no):
-        submission_result = submit_form(credentials, form_id, sentiment_level)
-        if submission_result.get("success"):
-            logger.info("Emulated submission completed!")
-        else:
-            logger.error(
-                f"Emulated submission failed. Reason: {submission_result.get('error')}"
+    # Every successful result is appended as one compact JSON line to a single
+    # file, opened on the first success and kept open for the rest of the run
+    results_filename = f"data/form_data_filled_{form_id}.jsonl"
+    results_file: Optional[BinaryIO] = None
+    saved_count = 0
+
+    def _on_result(submission_result: Dict[str, Any]) -> None:
+        nonlocal results_file, saved_count
+        _log_result(submission_result)
+        if not submission_result.get("success"):
+            return  # failures are only logged
+        if results_file is None:
+            os.makedirs("data", exist_ok=True)
+            results_file = open(results_filename, "ab")
+        results_file.write(json_io.dumps_line(submission_result))
+        saved_count += 1
+
+    try:
+        # Attempt the submission the specified number of times, concurrently
+        asyncio.run(
+            submit_forms_bulk(
+                credentials,
+                form_id,
+                repeat_no,
+                sentiment_level,
+                concurrency=concurrency,
+                on_result=_on_result,
+                answer_cache=args.answer_cache,
             )
+        )
+    finally:
+        if results_file is not None:
+            results_file.close()
+
+    if saved_count:
+        logger.info(
+            "%s submission result(s) for form %s saved to %s",
+            saved_count,
+            form_id,
+            results_filename,
+        )
+    else:
+        logger.warning("No successful submissions for form %s, nothing saved", form_id)
 
 
 if __name__ == "__main__":